@@ -1,281 +1,503 @@
-# app.py
-"""
-Streamlit app para comparar PDF firmado vs Word original.
-Genera un docx resaltando palabras agregadas/modificadas (rojo)
-y palabras eliminadas (subrayadas en azul). Tambi�n muestra
-un resumen de cambios e implicancias b�sicas.
-"""
-import streamlit as st
-from pdf2docx import Converter
-from docx import Document
-from docx.shared import RGBColor
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-import difflib, unidecode, re, tempfile, os, io
-from collections import Counter
-
-st.set_page_config(page_title="Comparador de Contratos", layout="centered")
-
-# ---------- UI ----------
-st.title("?? Comparador: contrato firmado vs. original")
-st.markdown(
-    "Sub� el **PDF firmado** y el **Word original**. La app convertir� el PDF a Word, "
-    "comparar� los textos y generar� un Word con los cambios resaltados.\n\n"
-    "**Rojo** = agregado/modificado � **Azul subrayado** = eliminado."
-)
-
-with st.expander("?? Notas importantes (leer)"):
-    st.write("""
-    - Si el PDF es un escaneo (imagen), la conversi�n no extraer� texto; se necesita OCR (Tesseract). 
-    - Archivos muy grandes pueden tardar. 
-    - Esto automatiza la revisi�n, pero cualquier decisi�n legal final debe validar el equipo legal.
-    """)
-
-pdf_file = st.file_uploader("1) Sub� el PDF firmado", type=["pdf"])
-word_file = st.file_uploader("2) Sub� el Word original (.docx)", type=["docx"])
-
-st.markdown("---")
-col1, col2 = st.columns([1, 3])
-with col1:
-    use_ai = st.checkbox("Agregar an�lisis de implicancias mediante OpenAI (opcional)")
-with col2:
-    if use_ai:
-        api_key = st.text_input("Peg� tu OpenAI API key (se usar� solo esta sesi�n)", type="password")
-    else:
-        api_key = None
-
-compare_btn = st.button("?? Comparar documentos")
-
-# ---------- helpers ----------
-def add_underline(run):
-    rPr = run._element.get_or_add_rPr()
-    u = OxmlElement('w:u')
-    u.set(qn('w:val'), 'single')
-    u.set(qn('w:color'), '0000FF')
-    rPr.append(u)
-
-def normalize(text):
-    text = unidecode.unidecode(text)
-    text = text.lower()
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
-
-def extract_text_from_docx(path):
-    doc = Document(path)
-    paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
-    return ' '.join(paragraphs)
-
-def convert_pdf_to_docx(pdf_path, out_docx_path):
-    cv = Converter(pdf_path)
-    cv.convert(out_docx_path, start=0, end=None)
-    cv.close()
-
-def highlight_changes(original_doc_path, new_doc_path, output_path):
-    """
-    Basado en tu versi�n original (la que te funcion� mejor).
-    Adem�s devuelve un resumen (counts, top palabras cambiadas).
-    """
-    text_old = extract_text_from_docx(original_doc_path)
-    text_new = extract_text_from_docx(new_doc_path)
-
-    norm_old = normalize(text_old)
-    norm_new = normalize(text_new)
-
-    sm = difflib.SequenceMatcher(None, norm_old.split(), norm_new.split())
-
-    doc_out = Document()
-    # leyenda
-    legend = doc_out.add_paragraph()
-    legend.add_run("?? Rojo: palabras agregadas o modificadas\n").font.color.rgb = RGBColor(255, 0, 0)
-    run_blue = legend.add_run("?? Azul subrayado: palabras eliminadas (presentes en original, no en PDF firmado)\n")
-    add_underline(run_blue)
-    doc_out.add_paragraph()
-
-    p = doc_out.add_paragraph()
-
-    new_words_original = text_new.split()
-    old_words_original = text_old.split()
-    idx_new_word = 0
-    idx_old_word = 0
-
-    # resumen colecciones
-    added_words = []
-    deleted_words = []
-    replaced_old = []
-    replaced_new = []
-
-    for tag, i1, i2, j1, j2 in sm.get_opcodes():
-        if tag == 'equal':
-            for _ in range(j2 - j1):
-                if idx_new_word < len(new_words_original):
-                    p.add_run(new_words_original[idx_new_word] + ' ')
-                    idx_new_word += 1
-                    idx_old_word += 1
-        elif tag == 'replace':
-            for _ in range(j2 - j1):
-                if idx_new_word < len(new_words_original):
-                    run = p.add_run(new_words_original[idx_new_word] + ' ')
-                    run.font.color.rgb = RGBColor(255, 0, 0)
-                    replaced_new.append(new_words_original[idx_new_word])
-                    idx_new_word += 1
-            for _ in range(i2 - i1):
-                if idx_old_word < len(old_words_original):
-                    run = p.add_run(old_words_original[idx_old_word] + ' ')
-                    add_underline(run)
-                    replaced_old.append(old_words_original[idx_old_word])
-                    idx_old_word += 1
-        elif tag == 'insert':
-            for _ in range(j2 - j1):
-                if idx_new_word < len(new_words_original):
-                    run = p.add_run(new_words_original[idx_new_word] + ' ')
-                    run.font.color.rgb = RGBColor(255, 0, 0)
-                    added_words.append(new_words_original[idx_new_word])
-                    idx_new_word += 1
-        elif tag == 'delete':
-            for _ in range(i2 - i1):
-                if idx_old_word < len(old_words_original):
-                    run = p.add_run(old_words_original[idx_old_word] + ' ')
-                    add_underline(run)
-                    deleted_words.append(old_words_original[idx_old_word])
-                    idx_old_word += 1
-
-    doc_out.save(output_path)
-
-    # resumen estad�stico
-    summary = {
-        "counts": {
-            "added": len(added_words),
-            "deleted": len(deleted_words),
-            "replaced_old": len(replaced_old),
-            "replaced_new": len(replaced_new)
-        },
-        "added_top": Counter([normalize(w) for w in added_words]).most_common(15),
-        "deleted_top": Counter([normalize(w) for w in deleted_words]).most_common(15),
-        "replaced_old_top": Counter([normalize(w) for w in replaced_old]).most_common(15),
-        "replaced_new_top": Counter([normalize(w) for w in replaced_new]).most_common(15),
-        "raw_lists": {
-            "added": added_words,
-            "deleted": deleted_words,
-            "replaced_old": replaced_old,
-            "replaced_new": replaced_new
-        }
-    }
-    return summary
-
-def infer_implications_from_terms(terms):
-    """
-    Heur�stico: busca palabras clave en 'terms' y devuelve implicancias t�picas.
-    No sustituye asesor�a legal.
-    """
-    keywords = {
-        ("penaliz", "penalty", "multa"): "Aumenta exposici�n financiera por penalizaciones.",
-        ("rescis", "rescisi�n", "resoluci"): "Reduce la capacidad de terminar el contrato anticipadamente.",
-        ("plazo", "fecha", "termino", "vence"): "Modifica plazos; puede afectar entregables y SLA.",
-        ("pago", "pagos", "factur"): "Impacta flujo de caja o condiciones de cobro/pago.",
-        ("indemn", "indemniz"): "Aumenta potenciales obligaciones de indemnizaci�n.",
-        ("confidenc", "confidential"): "Cambia condiciones de confidencialidad; riesgo de fuga de informaci�n.",
-        ("jurisdic", "ley aplicable", "arbitra"): "Cambia la jurisdicci�n o mecanismo de resoluci�n de conflictos.",
-        ("garant", "warranty", "garant�a"): "Modifica garant�as y responsabilidades por defectos."
-    }
-    implications = []
-    norm_terms = " ".join([normalize(t) for t in terms])
-    for keys, msg in keywords.items():
-        for k in keys:
-            if k in norm_terms:
-                implications.append(msg)
-                break
-    return list(dict.fromkeys(implications))  # �nicos
-
-# ---------- acci�n principal ----------
-if compare_btn:
-    if not pdf_file or not word_file:
-        st.error("Sub� ambos archivos (PDF y Word) para comparar.")
-    else:
-        with st.spinner("Procesando... esto puede tardar unos segundos"):
-            try:
-                with tempfile.TemporaryDirectory() as tmp:
-                    # Guardar archivos subidos
-                    pdf_path = os.path.join(tmp, pdf_file.name)
-                    with open(pdf_path, "wb") as f:
-                        f.write(pdf_file.getbuffer())
-
-                    word_path = os.path.join(tmp, word_file.name)
-                    with open(word_path, "wb") as f:
-                        f.write(word_file.getbuffer())
-
-                    # Convertir PDF -> docx
-                    converted_docx = os.path.join(tmp, "from_pdf.docx")
-                    convert_pdf_to_docx(pdf_path, converted_docx)
-
-                    # Comparar y generar doc final
-                    output_docx = os.path.join(tmp, "comparado.docx")
-                    summary = highlight_changes(word_path, converted_docx, output_docx)
-
-                    # Lectura para descarga
-                    with open(output_docx, "rb") as f:
-                        data_bytes = f.read()
-
-                    st.success("? Comparaci�n lista")
-                    st.download_button(
-                        label="?? Descargar DOCX con cambios",
-                        data=data_bytes,
-                        file_name=f"comparado_{os.path.splitext(pdf_file.name)[0]}.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                    )
-
-                    # Mostrar resumen
-                    st.markdown("### ?? Resumen r�pido de cambios")
-                    counts = summary["counts"]
-                    st.write(f"- Palabras agregadas: **{counts['added']}**")
-                    st.write(f"- Palabras eliminadas: **{counts['deleted']}**")
-                    st.write(f"- Reemplazos (old/new): **{counts['replaced_old']} / {counts['replaced_new']}**")
-
-                    st.markdown("#### ?? Top palabras agregadas")
-                    st.table(summary["added_top"][:10] if summary["added_top"] else "�")
-
-                    st.markdown("#### ?? Top palabras eliminadas")
-                    st.table(summary["deleted_top"][:10] if summary["deleted_top"] else "�")
-
-                    # Heur�stico de implicancias
-                    raw_changed_terms = summary["raw_lists"]["added"] + summary["raw_lists"]["deleted"] + summary["raw_lists"]["replaced_new"] + summary["raw_lists"]["replaced_old"]
-                    implications = infer_implications_from_terms(raw_changed_terms)
-                    st.markdown("### ?? Implicancias (heur�sticas)")
-                    if implications:
-                        for imp in implications:
-                            st.write(f"- {imp}")
-                    else:
-                        st.write("- No se detectaron t�rminos sensibles obvios. Revisar manualmente cl�usulas cr�ticas.")
-
-                    # Opcional: an�lisis con OpenAI (si el usuario lo pidi� y peg� la API key)
-                    if use_ai and api_key:
-                        try:
-                            st.markdown("### ?? An�lisis LLM (resumen + implicancias)")
-                            # Llamada a OpenAI (requiere 'openai' en requirements y la API key)
-                            import openai
-                            openai.api_key = api_key
-
-                            # Armamos prompt breve
-                            prompt = (
-                                "Act�a como analista legal de contratos. A partir de este breve resumen de cambios "
-                                "entre el contrato original y el firmado, genera un p�rrafo corto explicando "
-                                "las implicancias principales para la empresa contratante y dos recomendaciones de acci�n.\n\n"
-                                f"Resumen estad�stico: {counts}\n"
-                                f"Top agregadas: {summary['added_top'][:8]}\n"
-                                f"Top eliminadas: {summary['deleted_top'][:8]}\n\n"
-                                "Responde en espa�ol con bullets claros."
-                            )
-
-                            res = openai.ChatCompletion.create(
-                                model="gpt-4o-mini",  # si no disponible, usar "gpt-4o" o "gpt-4"
-                                messages=[{"role":"user","content":prompt}],
-                                max_tokens=400,
-                                temperature=0.2
-                            )
-                            text = res["choices"][0]["message"]["content"].strip()
-                            st.write(text)
-                        except Exception as e:
-                            st.error(f"No se pudo ejecutar el an�lisis LLM: {e}")
-                            st.info("Verific� que la API key y la disponibilidad del modelo sean correctas.")
-            except Exception as e:
-                st.error(f"Error durante el procesamiento: {e}")
-                st.info("Si el PDF es escaneado, consider� usar OCR antes de comparar.")
\ No newline at end of file
+# app.py
+"""
+Streamlit app para comparar PDF firmado vs Word original.
+Genera un docx resaltando palabras agregadas/modificadas (rojo)
+y palabras eliminadas (subrayadas en azul). También muestra
+un resumen de cambios e implicancias básicas.
+"""
+import streamlit as st
+import fitz  # PyMuPDF
+from docx import Document
+from docx.shared import RGBColor
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import qn, nsdecls
+import multiprocessing, re, tempfile, os, io, zipfile, unicodedata
+from xml.sax.saxutils import escape
+from lxml import etree
+from collections import Counter
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    # Drop-in acelerado en C; mismos opcodes que difflib.
+    from cdifflib import CSequenceMatcher as SequenceMatcher
+except ImportError:
+    from difflib import SequenceMatcher
+
+st.set_page_config(page_title="Comparador de Contratos", layout="centered")
+
+# ---------- UI ----------
+st.title("?? Comparador: contrato firmado vs. original")
+st.markdown(
+    "Subí el **PDF firmado** y el **Word original**. La app extraerá el texto del PDF, "
+    "comparará los textos y generará un Word con los cambios resaltados.\n\n"
+    "**Rojo** = agregado/modificado — **Azul subrayado** = eliminado."
+)
+
+with st.expander("?? Notas importantes (leer)"):
+    st.write("""
+    - Si el PDF es un escaneo (imagen), la conversión no extraerá texto; se necesita OCR (Tesseract).
+    - Archivos muy grandes pueden tardar.
+    - Esto automatiza la revisión, pero cualquier decisión legal final debe validar el equipo legal.
+    """)
+
+pdf_file = st.file_uploader("1) Subí el PDF firmado", type=["pdf"])
+word_file = st.file_uploader("2) Subí el Word original (.docx)", type=["docx"])
+
+st.markdown("---")
+col1, col2 = st.columns([1, 3])
+with col1:
+    use_ai = st.checkbox("Agregar análisis de implicancias mediante OpenAI (opcional)")
+with col2:
+    if use_ai:
+        api_key = st.text_input("Pegá tu OpenAI API key (se usará solo esta sesión)", type="password")
+    else:
+        api_key = None
+
+compare_btn = st.button("?? Comparar documentos")
+
+# ---------- helpers ----------
+# Menos texto que esto en todo el PDF => probablemente un escaneo.
+MIN_PDF_TEXT_CHARS = 200
+# Con pocos pares de párrafos cambiados no vale la pena levantar el pool.
+MIN_PAIRS_FOR_POOL = 10
+
+# Plantillas XML para los runs del docx de salida. Armar el XML como
+# string y parsearlo una sola vez por párrafo evita un round-trip por
+# lxml/python-docx por cada palabra (20k+ en un contrato grande).
+_RUN_PLAIN = '<w:r><w:t xml:space="preserve">%s</w:t></w:r>'
+_RUN_ADDED = '<w:r><w:rPr><w:color w:val="FF0000"/></w:rPr><w:t xml:space="preserve">%s</w:t></w:r>'
+_RUN_DELETED = '<w:r><w:rPr><w:u w:val="single" w:color="0000FF"/></w:rPr><w:t xml:space="preserve">%s</w:t></w:r>'
+
+def add_underline(run):
+    rPr = run._element.get_or_add_rPr()
+    u = OxmlElement('w:u')
+    u.set(qn('w:val'), 'single')
+    u.set(qn('w:color'), '0000FF')
+    rPr.append(u)
+
+@lru_cache(maxsize=200_000)
+def normalize_word(word):
+    """
+    Camino rápido para tokens sueltos (sin espacios internos, así que el
+    colapso de whitespace sobra). El cache evita re-normalizar las mismas
+    palabras: en un contrato se repiten miles de veces.
+    """
+    word = unicodedata.normalize('NFKD', word).encode('ascii', 'ignore').decode('ascii')
+    return word.lower().strip()
+
+def normalize_text(text):
+    """Normalización completa para los textos de documento enteros."""
+    # NFKD + encode('ascii','ignore') corre en C y saca los acentos igual
+    # que unidecode (pure-Python con tabla enorme) para texto en español.
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    text = text.lower()
+    # split()/join colapsa whitespace en un solo pase C, mucho más rápido
+    # que re.sub(r'\s+', ' ', ...) sobre documentos de varios MB.
+    return ' '.join(text.split())
+
+def as_token_ids(words_a, words_b):
+    """
+    Mapea cada palabra a un int chico compartido entre ambas listas.
+    Hashear/comparar ints dentro del matcher es mucho más barato que
+    hacerlo con strings, y los opcodes siguen siendo índices válidos
+    sobre las listas originales.
+    """
+    vocab = {}
+    ids_a = [vocab.setdefault(w, len(vocab)) for w in words_a]
+    ids_b = [vocab.setdefault(w, len(vocab)) for w in words_b]
+    return ids_a, ids_b
+
+_W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+def extract_paragraphs_from_docx(path):
+    """
+    Lee el texto directo del word/document.xml (zip + lxml). python-docx
+    construye el árbol completo de proxies CT_* aunque solo queramos el
+    texto; el pull crudo es un orden de magnitud más rápido para lectura.
+    """
+    with zipfile.ZipFile(path) as z:
+        xml = z.read('word/document.xml')
+    root = etree.fromstring(xml)
+    paragraphs = []
+    for p in root.iter('{%s}p' % _W_NS):
+        text = ''.join(t.text for t in p.iter('{%s}t' % _W_NS) if t.text)
+        # isspace() escanea en C y corta en el primer no-espacio, sin
+        # alocar la copia que strip() creaba solo para testear vacío.
+        if text and not text.isspace():
+            paragraphs.append(text)
+    return paragraphs
+
+def extract_paragraphs_from_pdf(pdf_path):
+    """
+    Extrae los párrafos del PDF directamente con PyMuPDF (mucho más rápido
+    que reconstruir un docx con pdf2docx solo para volver a leer el texto).
+    Cada bloque de texto de la página se toma como un párrafo.
+    Si el PDF casi no tiene texto (escaneo), intenta el camino viejo
+    vía pdf2docx como último recurso.
+    """
+    doc = fitz.open(pdf_path)
+    paragraphs = []
+    for page in doc:
+        for block in page.get_text("blocks"):
+            if block[6] == 0 and block[4] and not block[4].isspace():  # solo bloques de texto
+                paragraphs.append(' '.join(block[4].split()))
+    doc.close()
+    if sum(len(p) for p in paragraphs) >= MIN_PDF_TEXT_CHARS:
+        return paragraphs
+
+    # Fallback: conversión completa con pdf2docx (lento, pero a veces
+    # rescata texto que la extracción directa no ve).
+    from pdf2docx import Converter
+    tmp_docx = pdf_path + ".converted.docx"
+    cv = Converter(pdf_path)
+    cv.convert(tmp_docx, start=0, end=None)
+    cv.close()
+    try:
+        return extract_paragraphs_from_docx(tmp_docx)
+    finally:
+        os.remove(tmp_docx)
+
+def trimmed_opcodes(a, b):
+    """
+    Recorta prefijo y sufijo comunes antes de correr SequenceMatcher
+    (cuadrático en lo que queda) y reexpande los opcodes con el offset.
+    En contratos el preámbulo y el boilerplate final suelen ser idénticos
+    entre original y firmado, así que el recorte achica mucho N y M.
+    Sin autojunk: con la heurística activa los stop-words ("de", "la",
+    "el"...) que superan el 1% se tratan como basura y empeoran el match.
+    """
+    n_a, n_b = len(a), len(b)
+    limit = min(n_a, n_b)
+    pre = 0
+    while pre < limit and a[pre] == b[pre]:
+        pre += 1
+    suf = 0
+    while suf < limit - pre and a[n_a - 1 - suf] == b[n_b - 1 - suf]:
+        suf += 1
+    sm = SequenceMatcher(None, a[pre:n_a - suf], b[pre:n_b - suf], autojunk=False)
+    opcodes = []
+    if pre:
+        opcodes.append(('equal', 0, pre, 0, pre))
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        opcodes.append((tag, i1 + pre, i2 + pre, j1 + pre, j2 + pre))
+    if suf:
+        opcodes.append(('equal', n_a - suf, n_a, n_b - suf, n_b))
+    return opcodes
+
+def _diff_pair(pair):
+    """
+    Diff palabra a palabra de un par de párrafos crudos marcados
+    'replace'. Se matchea sobre los tokens normalizados pero se devuelven
+    las palabras originales: normalizar palabra por palabra preserva el
+    largo de la lista, así que los opcodes indexan ambas por igual y la
+    salida conserva mayúsculas y acentos. Función de módulo (picklable)
+    para poder correrla en un pool de procesos: cada par es independiente
+    y CPU-bound.
+    """
+    old_para, new_para = pair
+    old_words = old_para.split()
+    new_words = new_para.split()
+    ids_old, ids_new = as_token_ids([normalize_word(w) for w in old_words],
+                                    [normalize_word(w) for w in new_words])
+    return old_words, new_words, trimmed_opcodes(ids_old, ids_new)
+
+def highlight_changes(old_paras, new_paras, output_stream):
+    """
+    Compara los dos documentos y genera el docx resaltado.
+    Primero se comparan párrafos enteros (pocas unidades) y solo los
+    marcados como 'replace' pasan por el diff palabra a palabra: el
+    trabajo total baja de N² sobre palabras a P² sobre párrafos más
+    diffs chicos localizados. Devuelve un resumen (counts, top palabras).
+    """
+    # Los párrafos normalizados solo alimentan el matcher externo; la
+    # salida se escribe con el texto original (un deliverable legal tiene
+    # que conservar mayúsculas y acentos).
+    norm_old_paras = [normalize_text(p) for p in old_paras]
+    norm_new_paras = [normalize_text(p) for p in new_paras]
+
+    doc_out = Document()
+    # leyenda
+    legend = doc_out.add_paragraph()
+    legend.add_run("?? Rojo: palabras agregadas o modificadas\n").font.color.rgb = RGBColor(255, 0, 0)
+    run_blue = legend.add_run("?? Azul subrayado: palabras eliminadas (presentes en original, no en PDF firmado)\n")
+    add_underline(run_blue)
+    doc_out.add_paragraph()
+
+    # resumen: contadores alimentados dentro del loop de opcodes
+    # (un solo pase, sin listas intermedias de miles de strings)
+    added_ctr = Counter()
+    deleted_ctr = Counter()
+    replaced_old_ctr = Counter()
+    replaced_new_ctr = Counter()
+
+    # Un solo <w:r> por bloque contiguo del mismo estilo: los opcodes ya
+    # agrupan las palabras, así que unirlas achica el XML (y el archivo)
+    # por el largo promedio de cada bloque de cambio.
+    def runs_plain(parts, words):
+        if words:
+            parts.append(_RUN_PLAIN % escape(' '.join(words) + ' '))
+
+    def runs_added(parts, words, ctr):
+        if words:
+            parts.append(_RUN_ADDED % escape(' '.join(words) + ' '))
+            for w in words:
+                ctr[normalize_word(w)] += 1
+
+    def runs_deleted(parts, words, ctr):
+        if words:
+            parts.append(_RUN_DELETED % escape(' '.join(words) + ' '))
+            for w in words:
+                ctr[normalize_word(w)] += 1
+
+    def emit_paragraph(parts):
+        """Parsea todos los runs acumulados de una vez y los cuelga del párrafo."""
+        p = doc_out.add_paragraph()
+        if parts:
+            container = parse_xml('<w:p %s>%s</w:p>' % (nsdecls('w'), ''.join(parts)))
+            p._p.extend(container)
+
+    def write_word_diff(old_words, new_words, opcodes):
+        """Vuelca al docx el resultado de _diff_pair para un par de párrafos."""
+        parts = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == 'equal':
+                runs_plain(parts, new_words[j1:j2])
+            elif tag == 'replace':
+                runs_added(parts, new_words[j1:j2], replaced_new_ctr)
+                runs_deleted(parts, old_words[i1:i2], replaced_old_ctr)
+            elif tag == 'insert':
+                runs_added(parts, new_words[j1:j2], added_ctr)
+            elif tag == 'delete':
+                runs_deleted(parts, old_words[i1:i2], deleted_ctr)
+        emit_paragraph(parts)
+
+    # Diff externo a nivel párrafo: barato y localiza los cambios.
+    # Acá también conviene internar: el matcher hashea cada elemento y un
+    # párrafo entero es un string largo; con ids compara int contra int.
+    ids_old_paras, ids_new_paras = as_token_ids(norm_old_paras, norm_new_paras)
+    outer_opcodes = trimmed_opcodes(ids_old_paras, ids_new_paras)
+
+    # Los diffs anidados de cada par 'replace' son independientes entre sí;
+    # con muchos pares conviene repartirlos entre cores.
+    pairs = []
+    for tag, i1, i2, j1, j2 in outer_opcodes:
+        if tag == 'replace':
+            for k in range(min(i2 - i1, j2 - j1)):
+                pairs.append((old_paras[i1 + k], new_paras[j1 + k]))
+    # Solo con fork: bajo spawn (macOS/Windows) los workers tendrían que
+    # re-importar el script de Streamlit, que no es un módulo importable.
+    if (len(pairs) > MIN_PAIRS_FOR_POOL and (os.cpu_count() or 1) > 1
+            and multiprocessing.get_start_method() == 'fork'):
+        with ProcessPoolExecutor() as executor:
+            pair_results = list(executor.map(_diff_pair, pairs, chunksize=8))
+    else:
+        pair_results = [_diff_pair(pair) for pair in pairs]
+    next_pair_result = iter(pair_results).__next__
+
+    for tag, i1, i2, j1, j2 in outer_opcodes:
+        if tag == 'equal':
+            for para in new_paras[j1:j2]:
+                parts = []
+                runs_plain(parts, para.split())
+                emit_paragraph(parts)
+        elif tag == 'replace':
+            # Emparejar párrafos de a uno; los sobrantes son altas/bajas.
+            n_pairs = min(i2 - i1, j2 - j1)
+            for k in range(n_pairs):
+                write_word_diff(*next_pair_result())
+            for para in new_paras[j1 + n_pairs:j2]:
+                parts = []
+                runs_added(parts, para.split(), added_ctr)
+                emit_paragraph(parts)
+            for para in old_paras[i1 + n_pairs:i2]:
+                parts = []
+                runs_deleted(parts, para.split(), deleted_ctr)
+                emit_paragraph(parts)
+        elif tag == 'insert':
+            for para in new_paras[j1:j2]:
+                parts = []
+                runs_added(parts, para.split(), added_ctr)
+                emit_paragraph(parts)
+        elif tag == 'delete':
+            for para in old_paras[i1:i2]:
+                parts = []
+                runs_deleted(parts, para.split(), deleted_ctr)
+                emit_paragraph(parts)
+
+    doc_out.save(output_stream)
+
+    # resumen estadístico
+    summary = {
+        "counts": {
+            "added": sum(added_ctr.values()),
+            "deleted": sum(deleted_ctr.values()),
+            "replaced_old": sum(replaced_old_ctr.values()),
+            "replaced_new": sum(replaced_new_ctr.values())
+        },
+        "added_top": added_ctr.most_common(15),
+        "deleted_top": deleted_ctr.most_common(15),
+        "replaced_old_top": replaced_old_ctr.most_common(15),
+        "replaced_new_top": replaced_new_ctr.most_common(15),
+        # términos cambiados (ya normalizados y únicos) en un solo string,
+        # listo para el escaneo de implicancias sin re-concatenar listas
+        "norm_changed_blob": ' '.join(chain(added_ctr, deleted_ctr,
+                                            replaced_new_ctr, replaced_old_ctr))
+    }
+    return summary
+
+@st.cache_data(show_spinner=False)
+def _extract_pdf_paragraphs(pdf_bytes):
+    """Extracción cacheada por hash de los bytes del PDF subido."""
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_bytes)
+        pdf_path = f.name
+    try:
+        return extract_paragraphs_from_pdf(pdf_path)
+    finally:
+        os.remove(pdf_path)
+
+@st.cache_data(show_spinner=False)
+def _compute_diff(docx_bytes, pdf_bytes):
+    """
+    Diff completo cacheado por hash de ambos archivos. Streamlit re-ejecuta
+    todo el script ante cualquier interacción (p.ej. tildar el checkbox de
+    OpenAI); con el cache, repetir la comparación de los mismos archivos
+    vuelve en milisegundos. Devuelve (summary, bytes del docx resaltado).
+    """
+    new_paras = _extract_pdf_paragraphs(pdf_bytes)
+    # Todo en memoria: zipfile lee el docx desde BytesIO y Document.save
+    # acepta un file-like, así que no hay escritura/lectura a disco.
+    old_paras = extract_paragraphs_from_docx(io.BytesIO(docx_bytes))
+    buf = io.BytesIO()
+    summary = highlight_changes(old_paras, new_paras, buf)
+    return summary, buf.getvalue()
+
+# Palabras clave -> implicancia típica. No sustituye asesoría legal.
+KEYWORD_IMPLICATIONS = {
+    ("penaliz", "penalty", "multa"): "Aumenta exposición financiera por penalizaciones.",
+    ("rescis", "rescisión", "resoluci"): "Reduce la capacidad de terminar el contrato anticipadamente.",
+    ("plazo", "fecha", "termino", "vence"): "Modifica plazos; puede afectar entregables y SLA.",
+    ("pago", "pagos", "factur"): "Impacta flujo de caja o condiciones de cobro/pago.",
+    ("indemn", "indemniz"): "Aumenta potenciales obligaciones de indemnización.",
+    ("confidenc", "confidential"): "Cambia condiciones de confidencialidad; riesgo de fuga de información.",
+    ("jurisdic", "ley aplicable", "arbitra"): "Cambia la jurisdicción o mecanismo de resolución de conflictos.",
+    ("garant", "warranty", "garantía"): "Modifica garantías y responsabilidades por defectos."
+}
+
+try:
+    # Autómata Aho-Corasick: un solo pase lineal sobre el texto detecta
+    # todas las claves a la vez, en vez de un escaneo `in` por clave.
+    import ahocorasick
+    _KW_AUTOMATON = ahocorasick.Automaton()
+    for _keys, _msg in KEYWORD_IMPLICATIONS.items():
+        for _k in _keys:
+            _KW_AUTOMATON.add_word(_k, _msg)
+    _KW_AUTOMATON.make_automaton()
+except ImportError:
+    _KW_AUTOMATON = None
+
+# Fallback sin pyahocorasick: una sola alternación regex compilada (un
+# pase en C) en lugar de un escaneo `in` por cada clave.
+_KW_MSGS = [msg for keys, msg in KEYWORD_IMPLICATIONS.items() for _ in keys]
+_KW_RE = re.compile('|'.join(
+    '(?P<g%d>%s)' % (i, re.escape(k))
+    for i, k in enumerate(k for keys in KEYWORD_IMPLICATIONS for k in keys)
+))
+
+def infer_implications_from_terms(norm_terms):
+    """
+    Heurístico: busca palabras clave en el string ya normalizado de
+    términos cambiados y devuelve implicancias típicas.
+    No sustituye asesoría legal.
+    """
+    if _KW_AUTOMATON is not None:
+        hits = (msg for _, msg in _KW_AUTOMATON.iter(norm_terms))
+    else:
+        hits = (_KW_MSGS[int(m.lastgroup[1:])] for m in _KW_RE.finditer(norm_terms))
+    return list(dict.fromkeys(hits))  # únicos, en orden de aparición
+
+def _openai_chat_completion(api_key, prompt):
+    """Llamada bloqueante a OpenAI; pensada para correr en un thread."""
+    from openai import OpenAI
+    client = OpenAI(api_key=api_key)
+    res = client.chat.completions.create(
+        model="gpt-4o-mini",  # si no disponible, usar "gpt-4o" o "gpt-4"
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=400,
+        temperature=0.2
+    )
+    return res.choices[0].message.content.strip()
+
+# ---------- acción principal ----------
+if compare_btn:
+    if not pdf_file or not word_file:
+        st.error("Subí ambos archivos (PDF y Word) para comparar.")
+    else:
+        with st.spinner("Procesando... esto puede tardar unos segundos"):
+            try:
+                # Comparar y generar doc final (cacheado por contenido:
+                # re-ejecuciones de Streamlit con los mismos archivos no recalculan)
+                summary, data_bytes = _compute_diff(word_file.getvalue(), pdf_file.getvalue())
+                counts = summary["counts"]
+
+                # Disparar la llamada LLM (network-bound) en background
+                # apenas está el resumen, para solaparla con el armado de
+                # la descarga y el render de las tablas.
+                llm_future = None
+                if use_ai and api_key:
+                    prompt = (
+                        "Actúa como analista legal de contratos. A partir de este breve resumen de cambios "
+                        "entre el contrato original y el firmado, genera un párrafo corto explicando "
+                        "las implicancias principales para la empresa contratante y dos recomendaciones de acción.\n\n"
+                        f"Resumen estadístico: {counts}\n"
+                        f"Top agregadas: {summary['added_top'][:8]}\n"
+                        f"Top eliminadas: {summary['deleted_top'][:8]}\n\n"
+                        "Responde en español con bullets claros."
+                    )
+                    llm_executor = ThreadPoolExecutor(max_workers=1)
+                    llm_future = llm_executor.submit(_openai_chat_completion, api_key, prompt)
+
+                st.success("? Comparación lista")
+                st.download_button(
+                    label="?? Descargar DOCX con cambios",
+                    data=data_bytes,
+                    file_name=f"comparado_{os.path.splitext(pdf_file.name)[0]}.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                )
+
+                # Mostrar resumen
+                st.markdown("### ?? Resumen rápido de cambios")
+                st.write(f"- Palabras agregadas: **{counts['added']}**")
+                st.write(f"- Palabras eliminadas: **{counts['deleted']}**")
+                st.write(f"- Reemplazos (old/new): **{counts['replaced_old']} / {counts['replaced_new']}**")
+
+                st.markdown("#### ?? Top palabras agregadas")
+                st.table(summary["added_top"][:10] if summary["added_top"] else "—")
+
+                st.markdown("#### ?? Top palabras eliminadas")
+                st.table(summary["deleted_top"][:10] if summary["deleted_top"] else "—")
+
+                # Heurístico de implicancias
+                implications = infer_implications_from_terms(summary["norm_changed_blob"])
+                st.markdown("### ?? Implicancias (heurísticas)")
+                if implications:
+                    for imp in implications:
+                        st.write(f"- {imp}")
+                else:
+                    st.write("- No se detectaron términos sensibles obvios. Revisar manualmente cláusulas críticas.")
+
+                # Opcional: análisis con OpenAI (lanzado arriba en background)
+                if llm_future is not None:
+                    try:
+                        st.markdown("### ?? Análisis LLM (resumen + implicancias)")
+                        st.write(llm_future.result())
+                    except Exception as e:
+                        st.error(f"No se pudo ejecutar el análisis LLM: {e}")
+                        st.info("Verificá que la API key y la disponibilidad del modelo sean correctas.")
+                    finally:
+                        llm_executor.shutdown(wait=False)
+            except Exception as e:
+                st.error(f"Error durante el procesamiento: {e}")
+                st.info("Si el PDF es escaneado, considerá usar OCR antes de comparar.")